@@ -33,8 +33,9 @@ setup(
         'docopt',
         'pike>=0.1.0',
         'coverage',
-        'httpx>=0.23.0',
+        'httpx[http2]>=0.23.0',
         'python-dateutil>=2.8.2',
+        'orjson',
         'pyyaml',
         'ast-decompiler'
     ],
@@ -11,6 +11,7 @@ class ReportManager(object):
         self.specs = {}
         self.reporting_options = reporting_options or {}
         self.success = True
+        self.finished_cases = []
         self.reporters = {
             'testrail': TestRailRenderer(reporting_options),
         }
@@ -23,15 +24,35 @@ class ReportManager(object):
             if not spec.parent
         ]
 
-    def track_top_level(self, specs, all_inherited, metadata, test_names, exclude):
+    async def track_top_level(self, specs, all_inherited, metadata, test_names, exclude):
         for reporter in self.reporters.values():
             if reporter.enabled:
-                reporter.track_top_level(specs, all_inherited, metadata, test_names, exclude)
+                await reporter.track_top_level(
+                    specs,
+                    all_inherited,
+                    metadata,
+                    test_names,
+                    exclude
+                )
 
-    def start_reporting(self, dry_run):
+    async def start_reporting(self, dry_run):
         for reporter in self.reporters.values():
             if reporter.enabled:
-                reporter.start_reporting(dry_run)
+                await reporter.start_reporting(dry_run)
+
+    async def finish_reporting(self):
+        for name, reporter in self.reporters.items():
+            if not reporter.enabled:
+                continue
+
+            # Losing a remote reporter shouldn't take the local report with it
+            try:
+                try:
+                    await reporter.run_reporting(self.finished_cases)
+                finally:
+                    await reporter.finish_reporting()
+            except Exception:
+                log.exception('Failed to finish %s reporting', name)
 
     def track_spec(self, spec):
         self.specs[spec._id] = spec
@@ -50,10 +71,7 @@ class ReportManager(object):
         elif data.skipped:
             indicator = 'S'
 
-        for _, reporter in self.reporters.items():
-            if reporter.enabled:
-                reporter.report_case(spec, case)
-
+        self.finished_cases.append((spec, case))
         print(indicator, end='', flush=True)
 
     def spec_finished(self, spec):
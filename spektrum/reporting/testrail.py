@@ -1,11 +1,20 @@
+import asyncio
+import base64
+import functools
+from collections import deque
 from enum import Enum
 from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import urlencode
 
-from spektrum import utils
+from spektrum import logger, utils
 from spektrum.reporting.data import CaseFormatData, SpecFormatData
 from spektrum.reporting.transport import RetryTransport
 
 import httpx
+import orjson
+
+log = logger.get(__name__)
 
 UNICODE_SKIP = u'\u2607'
 UNICODE_SEP = u'\u221F'
@@ -14,6 +23,26 @@ UNICODE_ARROW_BAR = u'\u219B'
 UNICODE_CHECK = u'\u2713'
 UNICODE_X = u'\u2717'
 
+# Keyed by (required, success)
+EXPECT_PREFIXES = {
+    (True, True): f'{UNICODE_ARROW_BAR} {UNICODE_CHECK} ',
+    (True, False): f'{UNICODE_ARROW_BAR} {UNICODE_X} ',
+    (False, True): f'{UNICODE_ARROW} {UNICODE_CHECK} ',
+    (False, False): f'{UNICODE_ARROW} {UNICODE_X} ',
+}
+
+MAX_CONCURRENT_REQUESTS = 20
+MAX_CONCURRENT_CASE_CREATIONS = 10
+MAX_CONNECTIONS = 32
+RESULTS_BATCH_SIZE = 500
+RESULTS_BATCH_ATTEMPTS = 5
+
+_dumps = orjson.dumps
+
+# Class and case names repeat heavily across a suite
+_camelcase_to_spaces = functools.lru_cache(maxsize=4096)(utils.camelcase_to_spaces)
+_snakecase_to_spaces = functools.lru_cache(maxsize=4096)(utils.snakecase_to_spaces)
+
 
 class TestRailStatus(Enum):
     PASSED = 1
@@ -24,6 +53,11 @@ class TestRailStatus(Enum):
     SKIPPED = 7
 
 
+_STATUS_PASSED = TestRailStatus.PASSED.value
+_STATUS_SKIPPED = TestRailStatus.SKIPPED.value
+_STATUS_FAILED = TestRailStatus.FAILED.value
+
+
 class TestRailRenderer(object):
     def __init__(self, reporting_options=None):
         self.reporting_options = reporting_options or {}
@@ -34,6 +68,12 @@ class TestRailRenderer(object):
         self.run = self.reporting_options.get('tr_run')
         self.sections = {}
         self.specs = {}
+        self._path_index = {}
+        self._failed_paths = set()
+        self._pending = []
+        self._case_creation = {}
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self._case_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CASE_CREATIONS)
         self.tr = TestRailClient(
             endpoint=self.reporting_options.get('tr_endpoint'),
             username=self.reporting_options.get('tr_username'),
@@ -42,104 +82,188 @@ class TestRailRenderer(object):
 
         if self.tr.username and self.tr.api_key:
             self.enabled = True
-            self.sections = structure_testrail_dict(
-                self.tr.get_sections(self.project, self.suite).json()
-            )
 
-    def reconcile_spec_and_section(self, spec, metadata, test_names, exclude, sections=None):
+    def reconcile_spec_and_section(self, spec, metadata, test_names, exclude):
+        # Filtering already walks the children, and TestRailSpecData builds the
+        # whole subtree, so we only need to register what it built.
         utils.filter_cases_by_data(spec, metadata, test_names, exclude)
 
-        spec_data = TestRailSpecData(spec)
-        self._ensure_spec_hierarchy(spec_data, sections)
-        self.specs[spec_data.id] = spec_data
-
-        for child in spec_data.specs:
-            self.reconcile_spec_and_section(
-                child._spec,
-                metadata,
-                test_names,
-                exclude,
-                sections
-            )
+        queue = deque([TestRailSpecData(spec)])
+        while queue:
+            spec_data = queue.popleft()
+            self.specs[spec_data.id] = spec_data
+            queue.extend(spec_data.specs)
 
-    def _ensure_spec_hierarchy(self, spec_data, sections=None):
-        class_hierarchy = self._get_class_hierarchy(spec_data._spec)
-        all_sections = self._get_all_sections()
-        parent_id = None
+    async def _ensure_spec_hierarchy(self, spec_data):
+        path = self._get_section_path(spec_data._spec)
 
-        for i, class_name in enumerate(class_hierarchy):
-            section_name = utils.camelcase_to_spaces(class_name)
-            existing_section = self._find_existing_section(all_sections, section_name, parent_id)
+        if path not in self._path_index:
+            for depth in range(1, len(path) + 1):
+                if path[:depth] not in self._path_index:
+                    if not await self._add_section(path[:depth]):
+                        return
 
-            if existing_section:
-                section_id = existing_section['id']
-                suite_id = existing_section['suite_id']
-            else:
-                resp = self.tr.add_section(
-                    self.project,
-                    self.suite,
-                    name=section_name,
-                    description='',
-                    parent_id=parent_id,
-                )
-                if resp.status_code == 200:
-                    result = resp.json()
-                    section_id = result['id']
-                    suite_id = result['suite_id']
-                else:
-                    return
+        spec_data.section_id, spec_data.suite_id = self._path_index[path]
 
-            if i == len(class_hierarchy) - 1:
-                spec_data.section_id = section_id
-                spec_data.suite_id = suite_id
+    async def _add_section(self, path):
+        if path in self._failed_paths:
+            return False
 
-            parent_id = section_id
+        parent_id = None
+        if len(path) > 1:
+            if path[:-1] not in self._path_index:
+                self._failed_paths.add(path)
+                return False
+            parent_id, _ = self._path_index[path[:-1]]
+
+        try:
+            resp = await self.tr.add_section(
+                self.project,
+                self.suite,
+                name=path[-1],
+                description='',
+                parent_id=parent_id,
+            )
+            resp.raise_for_status()
+        except httpx.HTTPError as exc:
+            log.warning('Unable to create TestRail section %s: %s', ' > '.join(path), exc)
+            self._failed_paths.add(path)
+            return False
+
+        result = resp.json()
+        self._path_index[path] = (result['id'], result['suite_id'])
+        return True
 
     def _get_class_hierarchy(self, spec):
         qualname = spec.__class__.__qualname__
         hierarchy = qualname.split('.')
         return hierarchy
 
-    def _get_all_sections(self):
-        try:
-            response = self.tr.get_sections(self.project, self.suite)
-            if response.status_code == 200:
-                data = response.json()
-                sections = data.get('sections', [])
-                return sections
-            else:
-                return []
-        except Exception:
-            return []
+    def _get_section_path(self, spec):
+        return tuple(
+            _camelcase_to_spaces(class_name)
+            for class_name in self._get_class_hierarchy(spec)
+        )
 
-    def _find_existing_section(self, all_sections, name, parent_id):
-        for section in all_sections:
-            section_name = section.get('name', '')
-            section_parent_id = section.get('parent_id')
+    def _get_case_name(self, raw_case_name):
+        if '_' in raw_case_name:
+            return _snakecase_to_spaces(raw_case_name)
 
-            if section_name == name:
-                if parent_id == section_parent_id:
-                    return section
+        return _camelcase_to_spaces(raw_case_name)
 
-        return None
+    async def _bounded(self, coro):
+        async with self._semaphore:
+            return await coro
+
+    async def track_top_level(self, specs, all_inherited, metadata, test_names, exclude):
+        try:
+            data = await self.tr.get_sections(self.project, self.suite)
+        except httpx.HTTPError as exc:
+            # Without the existing sections we'd duplicate the whole tree
+            log.error('Disabling TestRail reporting, unable to load sections: %s', exc)
+            self.enabled = False
+            await self.tr.close()
+            return
+
+        self.sections = structure_testrail_dict(data)
+        self._path_index = index_testrail_paths(self.sections)
 
-    def track_top_level(self, specs, all_inherited, metadata, test_names, exclude):
         for spec in specs:
-            self.reconcile_spec_and_section(
-                spec,
-                metadata,
-                test_names,
-                exclude,
-                self.sections.values()
+            self.reconcile_spec_and_section(spec, metadata, test_names, exclude)
+
+        await self._create_missing_sections()
+        await self._create_missing_cases()
+
+    async def _create_missing_sections(self):
+        needed_sections = set()
+        for spec_data in self.specs.values():
+            path = self._get_section_path(spec_data._spec)
+            needed_sections.update(path[:depth] for depth in range(1, len(path) + 1))
+
+        needed_sections.difference_update(self._path_index)
+
+        # Parents have to exist before their children can be added, so we
+        # create the missing sections one level at a time.
+        for depth in sorted({len(path) for path in needed_sections}):
+            await asyncio.gather(*[
+                self._bounded(self._add_section(path))
+                for path in needed_sections
+                if len(path) == depth
+            ])
+
+        for spec_data in list(self.specs.values()):
+            await self._ensure_spec_hierarchy(spec_data)
+
+            if not spec_data.section_id:
+                # report_case ignores specs we aren't tracking
+                del self.specs[spec_data.id]
+
+    async def _create_missing_cases(self):
+        specs = [
+            spec_data
+            for spec_data in self.specs.values()
+            if spec_data.section_id and spec_data._spec.__test_cases__
+        ]
+        section_keys = list({(spec_data.suite_id, spec_data.section_id) for spec_data in specs})
+        section_cases = await asyncio.gather(
+            *[
+                self._bounded(self.tr.get_cases(self.project, suite_id, section_id))
+                for suite_id, section_id in section_keys
+            ],
+            return_exceptions=True
+        )
+
+        existing = {}
+        for (suite_id, section_id), tr_cases in zip(section_keys, section_cases):
+            if isinstance(tr_cases, Exception):
+                log.warning(
+                    'Skipping TestRail reporting for section %s, unable to load cases: %s',
+                    section_id,
+                    tr_cases,
+                )
+                continue
+
+            existing[(suite_id, section_id)] = {
+                tr_case['title']: tr_case
+                for tr_case in tr_cases
+            }
+
+        # Missing cases are created in the background while the specs run;
+        # report_case waits on them when it needs the case id.
+        for spec_data in specs:
+            tr_cases = existing.get((spec_data.suite_id, spec_data.section_id))
+            if tr_cases is None:
+                # report_case ignores specs we aren't tracking
+                del self.specs[spec_data.id]
+                continue
+
+            for case in spec_data._spec.__test_cases__:
+                case_name = self._get_case_name(case.__name__)
+                tr_case = tr_cases.get(case_name)
+
+                if tr_case:
+                    spec_data.track_case(tr_case, case.__name__, case_name)
+                else:
+                    self._schedule_case_creation(spec_data, case_name)
+
+    def _schedule_case_creation(self, cached_spec, case_name):
+        # Keyed the way TestRail identifies a case, so specs sharing a section
+        # share the creation too.
+        key = (cached_spec.suite_id, cached_spec.section_id, case_name)
+        if key not in self._case_creation:
+            self._case_creation[key] = asyncio.ensure_future(
+                self._create_case_on_demand(cached_spec, case_name)
             )
 
-    def start_reporting(self, dry_run):
+        return self._case_creation[key]
+
+    async def start_reporting(self, dry_run):
         if dry_run:
             return
 
         if not self.run:
             time = datetime.now().strftime('%m/%d/%Y, %H:%M:%S%p')
-            resp = self.tr.add_run(
+            resp = await self.tr.add_run(
                 project_id=self.project,
                 suite_id=self.suite,
                 name=f'Spektrum {time}'
@@ -147,69 +271,162 @@ class TestRailRenderer(object):
             if resp.status_code == 200:
                 self.run = resp.json()['id']
 
-    def report_case(self, spec, case):
+    async def run_reporting(self, cases):
+        results = await asyncio.gather(
+            *[
+                self._bounded(self.report_case(spec, case))
+                for spec, case in cases
+            ],
+            return_exceptions=True
+        )
+
+        # One bad case shouldn't cost the rest of the run's results
+        for (spec, case), result in zip(cases, results):
+            if isinstance(result, Exception):
+                log.error(
+                    'Failed to report %s.%s to TestRail: %s',
+                    type(spec).__qualname__,
+                    case.__name__,
+                    result,
+                )
+
+    async def finish_reporting(self):
+        try:
+            await asyncio.gather(*self._case_creation.values())
+            await self.flush_results()
+        finally:
+            await self.tr.close()
+
+    async def flush_results(self):
+        pending, self._pending = self._pending, []
+        if not self.run:
+            return
+
+        for i in range(0, len(pending), RESULTS_BATCH_SIZE):
+            batch = pending[i:i + RESULTS_BATCH_SIZE]
+
+            try:
+                resp = await self.tr.add_results_for_cases(run_id=self.run, results=batch)
+            except httpx.HTTPError as exc:
+                log.error('Failed to submit %d results to TestRail: %s', len(batch), exc)
+                self._log_lost_results(batch)
+                continue
+
+            if resp.is_success:
+                continue
+
+            log.warning(
+                'TestRail rejected %d results (HTTP %s): %s',
+                len(batch),
+                resp.status_code,
+                resp.text,
+            )
+
+            # Throttling and server errors were already retried as a batch;
+            # sending the results one at a time would only make them worse.
+            if is_retryable_response(resp):
+                self._log_lost_results(batch)
+            else:
+                # A single bad case fails validation for the whole batch
+                await self._submit_results_individually(batch)
+
+    async def _submit_results_individually(self, results):
+        responses = await asyncio.gather(
+            *[
+                self._bounded(self.tr.add_result_for_case(run_id=self.run, **result))
+                for result in results
+            ],
+            return_exceptions=True
+        )
+
+        self._log_lost_results([
+            result
+            for result, resp in zip(results, responses)
+            if isinstance(resp, BaseException) or not resp.is_success
+        ])
+
+    def _log_lost_results(self, results):
+        if results:
+            log.error(
+                'Failed to report %d result(s) to TestRail for case ids: %s',
+                len(results),
+                ', '.join(str(result['case_id']) for result in results),
+            )
+
+    async def report_case(self, spec, case):
         case_data = TestRailCaseData(spec, case)
         if spec._id not in self.specs:
             return
 
         cached_spec = self.specs[spec._id]
-        cached_case = next(
-            (c for c in cached_spec.cases if c.raw_name == case.__name__),
-            None
-        )
+        raw_case_name = case.__name__
+        cached_case = cached_spec.cases_by_raw.get(raw_case_name)
 
-        if cached_case and hasattr(cached_case, 'case_id'):
-            case_data.case_id = cached_case.case_id
-            case_data.section_id = cached_case.section_id
-        else:
-            case_data.case_id, case_data.section_id = self._create_case_on_demand(cached_spec, case)
+        if not cached_case:
+            case_name = self._get_case_name(raw_case_name)
 
-            if not case_data.case_id:
+            tr_case = await self._schedule_case_creation(cached_spec, case_name)
+            if not tr_case:
                 return
 
-        status = TestRailStatus.FAILED
-        if case_data.skipped:
-            status = TestRailStatus.SKIPPED
-        elif case_data.successful:
-            status = TestRailStatus.PASSED
+            cached_case = cached_spec.track_case(tr_case, raw_case_name, case_name)
+
+        case_data.case_id = cached_case.case_id
+        case_data.section_id = cached_case.section_id
+
+        status_id = (
+            _STATUS_SKIPPED if case_data.skipped
+            else _STATUS_PASSED if case_data.successful
+            else _STATUS_FAILED
+        )
 
         timespan = int(case_data.elapsed_time) or 1
 
         lines = []
-        mark = UNICODE_CHECK
         for expect in case_data.expects:
-            mark = UNICODE_CHECK if expect.success else UNICODE_X
-            arrow = UNICODE_ARROW_BAR if expect.required else UNICODE_ARROW
+            success = bool(expect.success)
+            lines.append(
+                f'{EXPECT_PREFIXES[(bool(expect.required), success)]}{expect.evaluation}'
+            )
 
-            lines.append(f'{arrow} {mark} {expect.evaluation}')
+            if success:
+                continue
 
-            if not expect.success:
-                lines.append('    Values:')
-                lines.append('    -------')
-                lines.append(f'    | {expect.target_name}: {expect.target}')
+            lines.extend((
+                '    Values:',
+                '    -------',
+                f'    | {expect.target_name}: {expect.target}',
+            ))
 
-                if str(expect.expected_name) != str(expect.expected):
-                    lines.append(f'    | {expect.expected_name}: {expect.expected}')
+            expected_name, expected = expect.expected_name, expect.expected
+            if type(expected_name) is not str:
+                expected_name = str(expected_name)
+            if type(expected) is not str:
+                expected = str(expected)
 
-        if case_data.errors:
-            lines.append('')
-            lines.append(utils.traceback_occurred_msg(case_data.error_type))
-            lines.append('-' * 40)
+            if expected_name != expected:
+                lines.append(f'    | {expected_name}: {expected}')
 
-            for error in case_data.errors:
-                for line in error:
-                    lines.append(line)
+        errors = case_data.errors
+        if errors:
+            lines.extend((
+                '',
+                utils.traceback_occurred_msg(case_data.error_type),
+                '-' * 40,
+            ))
+
+            for error in errors:
+                lines.extend(error)
 
         if not self.run:
             return
 
-        self.tr.add_result_for_case(
-            run_id=self.run,
-            case_id=case_data.case_id,
-            status=status,
-            elapsed=f'{timespan}s',
-            comment='\n'.join(lines),
-        )
+        self._pending.append({
+            'case_id': case_data.case_id,
+            'status_id': status_id,
+            'elapsed': f'{timespan}s',
+            'comment': '\n'.join(lines),
+        })
 
     def report_spec(self, spec):
         pass
@@ -217,61 +434,37 @@ class TestRailRenderer(object):
     def render(self, report):
         self.report = report
 
-    def _create_case_on_demand(self, cached_spec, case):
+    async def _create_case_on_demand(self, cached_spec, case_name):
         try:
-            raw_case_name = case.__name__ if hasattr(case, '__name__') else str(case)
-            if '_' in raw_case_name:
-                case_name = utils.snakecase_to_spaces(raw_case_name)
-            else:
-                case_name = utils.camelcase_to_spaces(raw_case_name)
+            async with self._case_semaphore:
+                tr_cases = await self.tr.get_cases(
+                    self.project,
+                    cached_spec.suite_id,
+                    cached_spec.section_id
+                )
+                tr_case = next(
+                    (c for c in tr_cases if c['title'] == case_name),
+                    None
+                )
 
-            tr_cases = self.tr.get_cases(self.project, cached_spec.suite_id, cached_spec.section_id)
-            tr_case = next(
-                (c for c in tr_cases if c['title'] == case_name),
-                None
-            )
+                if not tr_case:
+                    resp = await self.tr.add_case(
+                        cached_spec.section_id,
+                        case_name,
+                        template=self.template,
+                    )
+                    if resp.status_code != 200:
+                        return None
 
-            if tr_case:
-                case_id = tr_case['id']
-                section_id = tr_case['section_id']
-            else:
-                resp = self.tr.add_case(
-                    cached_spec.section_id,
-                    case_name,
-                    template=self.template,
-                )
-                if resp.status_code == 200:
-                    result = resp.json()
-                    case_id = result['id']
-                    section_id = result['section_id']
-                else:
-                    return None, None
-
-            class CachedCase:
-                def __init__(self, case_id, section_id, raw_name, name):
-                    self.case_id = case_id
-                    self.section_id = section_id
-                    self.raw_name = raw_name
-                    self.name = name
-
-            new_case = CachedCase(
-                case_id=case_id,
-                section_id=section_id,
-                raw_name=raw_case_name,
-                name=case_name
-            )
-            cached_spec.cases.append(new_case)
+                    tr_case = resp.json()
 
-            return case_id, section_id
+            return tr_case
 
         except Exception:
-            return None, None
+            return None
 
     def get_cached_case_data(self, spec, raw_name):
-        return next(
-            (case for case in self.specs[spec._id].cases if case.raw_name == raw_name),
-            None
-        )
+        return self.specs[spec._id].cases_by_raw.get(raw_name)
 
 
 class TestRailCaseData(CaseFormatData):
@@ -289,6 +482,26 @@ class TestRailSpecData(SpecFormatData):
         self.section_id = None
         self.suite_id = None
         self.cases = []
+        self.cases_by_raw = {}
+
+    def track_case(self, tr_case, raw_name, name):
+        cached_case = TestRailCachedCase(
+            case_id=tr_case['id'],
+            section_id=tr_case['section_id'],
+            raw_name=raw_name,
+            name=name,
+        )
+        self.cases.append(cached_case)
+        self.cases_by_raw[raw_name] = cached_case
+        return cached_case
+
+
+class TestRailCachedCase(object):
+    def __init__(self, case_id, section_id, raw_name, name):
+        self.case_id = case_id
+        self.section_id = section_id
+        self.raw_name = raw_name
+        self.name = name
 
 
 class TestRailClient(object):
@@ -297,162 +510,281 @@ class TestRailClient(object):
         self.username = username
         self.api_key = api_key
         self._transport = RetryTransport(
-            wrapped_transport=httpx.HTTPTransport(),
+            wrapped_transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=0,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                    keepalive_expiry=60,
+                ),
+            ),
             max_attempts=5,
             backoff_factor=15
         )
-        self._client = httpx.Client(transport=self._transport)
-
-    def _get_paginated(self, item_collection, url=None, auth=None, params=None, timeout=None):
-        resp = self._client.get(url, auth=auth, params=params, timeout=timeout)
-        data = resp.json()
-        offset = data.get('offset', 0)
-        limit = data.get('limit', 150)
-        items = data.get(item_collection, [])
-
-        if data.get('_links', {}).get('next'):
-            params.update({
-                'offset': offset + limit,
-                'limit': limit,
-            })
-            items.extend(
-                self._get_paginated(item_collection, url=url, auth=auth, params=params)
-            )
-
-        return items
-
-    def add_result_for_case(self, run_id, case_id, status, elapsed, comment):
-        body = utils.clean_dictionary({
-            'status_id': status.value,
-            'elapsed': elapsed,
-            'comment': comment,
-        })
+        token = base64.b64encode(f'{username}:{api_key}'.encode()).decode()
+        self._client = httpx.AsyncClient(
+            transport=self._transport,
+            timeout=30,
+            headers={
+                'Authorization': f'Basic {token}',
+                'Content-Type': 'application/json',
+            },
+        )
 
-        return self._client.post(
+        # Sections and cases don't change underneath us during a run, so we only
+        # fetch them once and keep the caches current as we add to them.
+        self._sections_cache = {}
+        self._cases_cache = {}
+        self._inflight = {}
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _coalesce(self, key, coro_fn):
+        # Concurrent identical calls wait on the first one instead of issuing
+        # their own request. The request runs in its own task so cancelling
+        # any one caller doesn't cancel it for the others.
+        if key not in self._inflight:
+            task = asyncio.ensure_future(coro_fn())
+            task.add_done_callback(functools.partial(self._settle_inflight, key))
+            self._inflight[key] = task
+
+        return await asyncio.shield(self._inflight[key])
+
+    def _settle_inflight(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+        # Mark it retrieved so asyncio doesn't warn when every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def _build_url(self, path, params=None):
+        # TestRail routes on the query string itself (index.php?/api/v2/...), so
+        # handing params to httpx would replace the route rather than extend it.
+        url = f'{self.endpoint}/api/v2/{path}'
+        if params:
+            url = f'{url}&{urlencode(params)}'
+
+        return url
+
+    async def _get_paginated(self, item_collection, path, params=None, timeout=None):
+        params = dict(params or {})
+        items = []
+
+        while True:
+            resp = await self._client.get(self._build_url(path, params), timeout=timeout)
+            resp.raise_for_status()
+            data = resp.json()
+            items.extend(data.get(item_collection, []))
+
+            if not data.get('_links', {}).get('next'):
+                return items
+
+            limit = data.get('limit', 150)
+            params['offset'] = data.get('offset', 0) + limit
+            params['limit'] = limit
+
+    async def add_result_for_case(self, run_id, case_id, status_id, elapsed, comment):
+        body = {'status_id': status_id, 'elapsed': elapsed}
+        if comment is not None:
+            body['comment'] = comment
+
+        return await self._client.post(
             f'{self.endpoint}/api/v2/add_result_for_case/{run_id}/{case_id}',
-            json=body,
-            auth=(self.username, self.api_key),
+            content=_dumps(body),
             timeout=30,
         )
 
-    def add_run(self, project_id, suite_id, name):
-        body = utils.clean_dictionary({
-            'suite_id': suite_id,
-            'name': name,
-        })
+    async def add_results_for_cases(self, run_id, results):
+        # RetryTransport leaves POSTs alone, but a throttled or failed batch is
+        # worth retrying as a whole.
+        content = _dumps({'results': results})
+        attempts_made = 0
+
+        while True:
+            resp = await self._client.post(
+                f'{self.endpoint}/api/v2/add_results_for_cases/{run_id}',
+                content=content,
+                timeout=30,
+            )
+            attempts_made += 1
+
+            if attempts_made >= RESULTS_BATCH_ATTEMPTS or not is_retryable_response(resp):
+                return resp
 
-        return self._client.post(
+            await asyncio.sleep(self._transport._calculate_sleep(attempts_made, resp.headers))
+
+    async def add_run(self, project_id, suite_id, name):
+        body = {'name': name}
+        if suite_id is not None:
+            body['suite_id'] = suite_id
+
+        return await self._client.post(
             f'{self.endpoint}/api/v2/add_run/{project_id}',
-            json=body,
-            auth=(self.username, self.api_key),
+            content=_dumps(body),
             timeout=30,
         )
 
-    def add_section(self, project_id, suite_id, name, description='', parent_id=None):
-        body = utils.clean_dictionary({
-            'suite_id': suite_id,
-            'name': name,
-            'description': description,
-            'parent_id': parent_id,
-        })
+    async def add_section(self, project_id, suite_id, name, description='', parent_id=None):
+        return await self._coalesce(
+            ('add_section', project_id, suite_id, name, parent_id),
+            functools.partial(
+                self._add_section,
+                project_id,
+                suite_id,
+                name,
+                description,
+                parent_id
+            )
+        )
+
+    async def _add_section(self, project_id, suite_id, name, description, parent_id):
+        body = {'name': name}
+        if suite_id is not None:
+            body['suite_id'] = suite_id
+        if description is not None:
+            body['description'] = description
+        if parent_id is not None:
+            body['parent_id'] = parent_id
 
-        return self._client.post(
+        resp = await self._client.post(
             f'{self.endpoint}/api/v2/add_section/{project_id}',
-            json=body,
-            auth=(self.username, self.api_key),
+            content=_dumps(body),
             timeout=30,
         )
 
-    def add_case(self, section_id, title, template=None, description=None):
-        body = utils.clean_dictionary({
-            'title': title,
-            'template_id': template,
-            'custom_description': description,
-        })
+        cached = self._sections_cache.get((project_id, suite_id))
+        if resp.status_code == 200 and cached is not None:
+            cached.setdefault('sections', []).append(resp.json())
+
+        return resp
+
+    async def add_case(self, section_id, title, template=None, description=None):
+        return await self._coalesce(
+            ('add_case', section_id, title),
+            functools.partial(self._add_case, section_id, title, template, description)
+        )
 
-        return self._client.post(
+    async def _add_case(self, section_id, title, template, description):
+        body = {'title': title}
+        if template is not None:
+            body['template_id'] = template
+        if description is not None:
+            body['custom_description'] = description
+
+        resp = await self._client.post(
             f'{self.endpoint}/api/v2/add_case/{section_id}',
-            json=body,
-            auth=(self.username, self.api_key),
+            content=_dumps(body),
             timeout=30,
         )
 
-    def update_case(self, case_id, **kwargs):
-        body = utils.clean_dictionary(kwargs)
+        if resp.status_code == 200:
+            result = resp.json()
+            for key in ((result['suite_id'], section_id), (result['suite_id'], None)):
+                if key in self._cases_cache:
+                    self._cases_cache[key].append(result)
+
+        return resp
+
+    async def update_case(self, case_id, **kwargs):
+        body = {k: v for k, v in kwargs.items() if v is not None}
 
-        return self._client.post(
+        return await self._client.post(
             f'{self.endpoint}/api/v2/update_case/{case_id}',
-            json=body,
-            auth=(self.username, self.api_key),
+            content=_dumps(body),
             timeout=30
         )
 
-    def get_sections(self, project_id, suite_id):
-        return self._client.get(
-            f'{self.endpoint}/api/v2/get_sections/{project_id}/&suite_id={suite_id}',
-            auth=(self.username, self.api_key),
+    async def get_sections(self, project_id, suite_id):
+        key = (project_id, suite_id)
+        if key in self._sections_cache:
+            return self._sections_cache[key]
+
+        return await self._coalesce(
+            ('get_sections', *key),
+            functools.partial(self._get_sections, project_id, suite_id)
+        )
+
+    async def _get_sections(self, project_id, suite_id):
+        resp = await self._client.get(
+            self._build_url(f'get_sections/{project_id}', {'suite_id': suite_id}),
             timeout=30,
         )
+        resp.raise_for_status()
+
+        self._sections_cache[(project_id, suite_id)] = resp.json()
+        return self._sections_cache[(project_id, suite_id)]
+
+    async def get_cases(self, project_id, suite_id, section_id=None):
+        # Suite ids are unique across projects, which lets add_case keep this
+        # current without knowing the project.
+        key = (suite_id, section_id)
+        if key in self._cases_cache:
+            return self._cases_cache[key]
+
+        return await self._coalesce(
+            ('get_cases', *key),
+            functools.partial(self._get_cases, project_id, suite_id, section_id)
+        )
 
-    def get_cases(self, project_id, suite_id, section_id=None):
+    async def _get_cases(self, project_id, suite_id, section_id):
+        key = (suite_id, section_id)
         parameters = {
-            f'/api/v2/get_cases/{project_id}': None,
             'suite_id': suite_id,
             'limit': 100,
         }
         if section_id:
             parameters['section_id'] = section_id
 
-        return self._get_paginated(
+        self._cases_cache[key] = await self._get_paginated(
             'cases',
-            url=f'{self.endpoint}',
-            auth=(self.username, self.api_key),
+            f'get_cases/{project_id}',
             params=parameters,
             timeout=30
         )
+        return self._cases_cache[key]
 
 
-def restructure(sections, level=0, structured=None):
-    structured = structured or {}
+def is_retryable_response(resp):
+    return resp.status_code == HTTPStatus.TOO_MANY_REQUESTS or resp.is_server_error
 
-    at_depth = {k: v for k, v in sections.items() if v['depth'] == level}
 
-    for section_id, section in at_depth.items():
-        parent_id = section['parent_id']
-
-        if parent_id and parent_id not in structured:
-            parent = sections[parent_id]
-            structured[parent['id']] = parent
-
-            if 'children' not in structured[parent['id']]:
-                structured[parent['id']]['children'] = {}
-
-            structured[parent_id]['children'][section_id] = section
+def structure_testrail_dict(data):
+    flattened = {
+        section['id']: {**section, 'children': {}}
+        for section in data.get('sections', [])
+    }
+    structured = {}
 
-        elif parent_id and parent_id in structured:
-            structured[parent_id]['children'][section_id] = section
+    for section_id, section in flattened.items():
+        parent_id = section.get('parent_id')
 
-        elif parent_id is None and section_id not in structured:
+        if parent_id in flattened:
+            flattened[parent_id]['children'][section_id] = section
+        else:
             structured[section_id] = section
-            structured[section_id]['children'] = {}
 
     return structured
 
 
-def flatten_testrail_dict(data):
-    return {section['id']: section for section in data.get('sections')}
+def index_testrail_paths(structured):
+    index = {}
+    queue = deque([((), structured)])
 
+    while queue:
+        path, sections = queue.popleft()
 
-def structure_testrail_dict(data):
-    flattened = flatten_testrail_dict(data)
-    depth_list = [v['depth'] for _, v in flattened.items()]
-    max_depth = 1
+        for section in sections.values():
+            section_path = (*path, section['name'])
 
-    if len(depth_list) > 0:
-        max_depth = max(depth_list)
+            # Like TestRail lookups by name, the first section wins; its
+            # duplicates' subtrees are unreachable by path so we skip them.
+            if section_path in index:
+                continue
 
-    restructured = None
-    for i in range(max_depth, -1, -1):
-        restructured = restructure(flattened, i, restructured)
+            index[section_path] = (section['id'], section['suite_id'])
+            queue.append((section_path, section['children']))
 
-    return restructured
+    return index
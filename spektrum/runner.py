@@ -43,13 +43,13 @@ class SpektrumRunner(object):
                 )
 
             instantiated = [cls() for cls in selected_modules]
-            self.reporting.track_top_level(
+            loop.run_until_complete(self.reporting.track_top_level(
                 instantiated,
                 all_inherited,
                 metadata,
                 test_names,
                 exclude
-            )
+            ))
 
             # TODO(jmvrbanac): Change how nested specs are executed
             # coroutines = []
@@ -66,7 +66,7 @@ class SpektrumRunner(object):
 
             # future = asyncio.gather(*coroutines)
 
-            self.reporting.start_reporting(dry_run)
+            loop.run_until_complete(self.reporting.start_reporting(dry_run))
             future = asyncio.gather(*[
                 execute_spec(
                     spec,
@@ -82,6 +82,7 @@ class SpektrumRunner(object):
             ])
 
             loop.run_until_complete(future)
+            loop.run_until_complete(self.reporting.finish_reporting())
             print('\n', flush=True)
 
             report = self.reporting.build_report()
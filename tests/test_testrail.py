@@ -0,0 +1,497 @@
+import asyncio
+import itertools
+
+import httpx
+import orjson
+import pytest
+
+from spektrum import Spec, expect, require
+from spektrum.reporting import testrail
+from spektrum.reporting.core import ReportManager
+from spektrum.reporting.testrail import index_testrail_paths, structure_testrail_dict
+from spektrum.runner import execute_spec
+
+
+def test_structure_testrail_dict_nests_children():
+    data = {
+        'sections': [
+            {'id': 3, 'name': 'Grandchild', 'parent_id': 2, 'depth': 2},
+            {'id': 1, 'name': 'Root', 'parent_id': None, 'depth': 0},
+            {'id': 2, 'name': 'Child', 'parent_id': 1, 'depth': 1},
+            {'id': 4, 'name': 'Other Root', 'parent_id': None, 'depth': 0},
+        ]
+    }
+
+    structured = structure_testrail_dict(data)
+
+    assert list(structured) == [1, 4]
+    assert list(structured[1]['children']) == [2]
+    assert list(structured[1]['children'][2]['children']) == [3]
+    assert structured[1]['children'][2]['children'][3]['children'] == {}
+    assert structured[4]['children'] == {}
+
+
+def test_structure_testrail_dict_without_sections():
+    assert structure_testrail_dict({}) == {}
+
+
+def test_index_testrail_paths_uses_section_names():
+    structured = structure_testrail_dict({
+        'sections': [
+            {'id': 1, 'suite_id': 9, 'name': 'Root', 'parent_id': None},
+            {'id': 2, 'suite_id': 9, 'name': 'Child', 'parent_id': 1},
+        ]
+    })
+
+    assert index_testrail_paths(structured) == {
+        ('Root',): (1, 9),
+        ('Root', 'Child'): (2, 9),
+    }
+
+    # Duplicate names resolve within the first matching parent's subtree
+    structured = structure_testrail_dict({
+        'sections': [
+            {'id': 1, 'suite_id': 9, 'name': 'A', 'parent_id': None},
+            {'id': 2, 'suite_id': 9, 'name': 'A', 'parent_id': None},
+            {'id': 3, 'suite_id': 9, 'name': 'B', 'parent_id': 1},
+            {'id': 4, 'suite_id': 9, 'name': 'B', 'parent_id': 2},
+        ]
+    })
+
+    assert index_testrail_paths(structured) == {
+        ('A',): (1, 9),
+        ('A', 'B'): (3, 9),
+    }
+
+
+def test_get_cases_keeps_route_in_query_across_pages():
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        offset = int(request.url.params.get('offset', 0))
+        return httpx.Response(200, json={
+            'offset': offset,
+            'limit': 1,
+            'cases': [{'id': offset}],
+            '_links': {'next': 'more' if offset < 1 else None},
+        })
+
+    client = testrail.TestRailClient('https://example.testrail.io', 'user', 'key')
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    cases = asyncio.run(client.get_cases(1, 2, section_id=3))
+
+    assert cases == [{'id': 0}, {'id': 1}]
+    assert requested == [
+        'https://example.testrail.io/index.php?/api/v2/get_cases/1'
+        '&suite_id=2&limit=100&section_id=3',
+        'https://example.testrail.io/index.php?/api/v2/get_cases/1'
+        '&suite_id=2&limit=1&section_id=3&offset=1',
+    ]
+
+
+def can_be_reported(self):
+    pass
+
+
+class SharedSpec(Spec):
+    can_be_reported = can_be_reported
+
+
+# Same class name from another module, so it maps to the same section
+OtherSharedSpec = type('SharedSpec', (Spec,), {
+    '__module__': 'other.module',
+    'can_be_reported': can_be_reported,
+})
+
+
+class NestingSpec(Spec):
+    class NestedSpec(Spec):
+        def is_nested(self):
+            pass
+
+    def is_nesting(self):
+        pass
+
+
+def make_renderer(handler):
+    renderer = testrail.TestRailRenderer({
+        'tr_endpoint': 'https://example.testrail.io',
+        'tr_username': 'user',
+        'tr_apikey': 'key',
+        'tr_project': 1,
+        'tr_suite': 2,
+    })
+    renderer.tr._transport._wrapped_transport = httpx.MockTransport(handler)
+    return renderer
+
+
+def route(request):
+    return request.url.query.decode().split('&')[0]
+
+
+def pending_results(count):
+    return [
+        {'case_id': case_id, 'status_id': 1, 'elapsed': '1s', 'comment': ''}
+        for case_id in range(count)
+    ]
+
+
+def test_flush_results_submits_in_batches():
+    batches = []
+
+    def handler(request):
+        batches.append(len(orjson.loads(request.content)['results']))
+        return httpx.Response(200, json=[])
+
+    renderer = make_renderer(handler)
+    renderer.run = 5
+    renderer._pending = pending_results(testrail.RESULTS_BATCH_SIZE + 1)
+
+    asyncio.run(renderer.finish_reporting())
+
+    assert batches == [testrail.RESULTS_BATCH_SIZE, 1]
+    assert renderer._pending == []
+
+
+def test_flush_results_falls_back_to_single_results(caplog):
+    single = []
+
+    def handler(request):
+        if route(request).startswith('/api/v2/add_results_for_cases/'):
+            return httpx.Response(400, json={'error': 'Field :results cannot be empty'})
+
+        case_id = route(request).rsplit('/', 1)[-1]
+        single.append(case_id)
+        return httpx.Response(400 if case_id == '1' else 200, json={})
+
+    renderer = make_renderer(handler)
+    renderer.run = 5
+    renderer._pending = pending_results(3)
+
+    asyncio.run(renderer.finish_reporting())
+
+    assert sorted(single) == ['0', '1', '2']
+    assert 'for case ids: 1' in caplog.text
+
+
+def test_failed_get_sections_disables_reporting():
+    requested = []
+
+    def handler(request):
+        requested.append(route(request))
+        return httpx.Response(400, json={'error': 'Field :suite_id is not a valid test suite.'})
+
+    renderer = make_renderer(handler)
+
+    asyncio.run(renderer.track_top_level([], [], None, None, None))
+
+    assert renderer.enabled is False
+    assert requested == ['/api/v2/get_sections/1']
+
+
+def test_failed_get_cases_is_not_cached():
+    responses = [
+        httpx.Response(500, json={'error': 'Internal error'}),
+        httpx.Response(200, json={'cases': [{'id': 7}], '_links': {'next': None}}),
+    ]
+
+    def handler(request):
+        return responses.pop(0)
+
+    client = make_renderer(handler).tr
+
+    async def fetch_twice():
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.get_cases(1, 2, section_id=3)
+
+        return await client.get_cases(1, 2, section_id=3)
+
+    assert asyncio.run(fetch_twice()) == [{'id': 7}]
+
+
+def test_failed_get_cases_skips_reporting_for_its_specs():
+    requested = []
+
+    def handler(request):
+        requested.append(route(request))
+        if route(request) == '/api/v2/get_sections/1':
+            return httpx.Response(200, json={'sections': [
+                {'id': 10, 'suite_id': 2, 'name': 'Shared Spec', 'parent_id': None},
+            ]})
+
+        raise httpx.ConnectError('Connection refused', request=request)
+
+    renderer = make_renderer(handler)
+    spec = SharedSpec()
+
+    asyncio.run(renderer.track_top_level([spec], [], None, None, None))
+
+    assert spec._id not in renderer.specs
+    assert renderer._case_creation == {}
+    assert requested == ['/api/v2/get_sections/1', '/api/v2/get_cases/1']
+
+
+def test_failed_section_is_not_retried_per_spec():
+    requested = []
+
+    def handler(request):
+        requested.append(route(request))
+        if route(request) == '/api/v2/get_sections/1':
+            return httpx.Response(200, json={'sections': []})
+
+        return httpx.Response(400, json={'error': 'Field :name is too long.'})
+
+    renderer = make_renderer(handler)
+    specs = [SharedSpec(), NestingSpec()]
+
+    asyncio.run(renderer.track_top_level(specs, [], None, None, None))
+
+    assert sorted(requested) == [
+        '/api/v2/add_section/1',
+        '/api/v2/add_section/1',
+        '/api/v2/get_sections/1',
+    ]
+    assert renderer.specs == {}
+
+
+def test_specs_sharing_a_section_create_a_case_once():
+    requested = []
+
+    async def handler(request):
+        requested.append(route(request))
+        await asyncio.sleep(0.01)
+
+        if route(request) == '/api/v2/get_sections/1':
+            return httpx.Response(200, json={'sections': [
+                {'id': 10, 'suite_id': 2, 'name': 'Shared Spec', 'parent_id': None},
+            ]})
+        elif route(request) == '/api/v2/get_cases/1':
+            return httpx.Response(200, json={'cases': [], '_links': {'next': None}})
+
+        return httpx.Response(200, json={
+            'id': 20,
+            'suite_id': 2,
+            'section_id': 10,
+            'title': orjson.loads(request.content)['title'],
+        })
+
+    renderer = make_renderer(handler)
+    specs = [SharedSpec(), OtherSharedSpec()]
+
+    async def track():
+        await renderer.track_top_level(specs, [], None, None, None)
+        return await asyncio.gather(*renderer._case_creation.values())
+
+    created = asyncio.run(track())
+
+    assert requested.count('/api/v2/add_case/10') == 1
+    assert [tr_case['id'] for tr_case in created] == [20]
+
+
+def test_concurrent_identical_calls_share_one_request():
+    requested = []
+
+    async def handler(request):
+        requested.append(route(request))
+        await asyncio.sleep(0.01)
+
+        if route(request).startswith('/api/v2/get_cases/'):
+            return httpx.Response(200, json={'cases': [{'id': 7}], '_links': {'next': None}})
+
+        return httpx.Response(200, json={'id': 8, 'suite_id': 2, 'section_id': 3})
+
+    client = make_renderer(handler).tr
+
+    async def fetch():
+        return await asyncio.gather(
+            *[client.get_cases(1, 2, section_id=3) for _ in range(3)],
+            *[client.add_section(1, 2, 'Section', parent_id=None) for _ in range(3)],
+            *[client.add_case(3, 'Case') for _ in range(3)],
+        )
+
+    results = asyncio.run(fetch())
+
+    assert sorted(requested) == [
+        '/api/v2/add_case/3',
+        '/api/v2/add_section/1',
+        '/api/v2/get_cases/1',
+    ]
+    assert results[0] is results[1] is results[2]
+    assert results[3] is results[4] is results[5]
+    assert results[6] is results[7] is results[8]
+    assert client._inflight == {}
+
+
+def test_coalesced_failure_reaches_every_waiter():
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError('bam')
+
+    client = make_renderer(None).tr
+
+    async def run():
+        return await asyncio.gather(
+            *[client._coalesce('key', fail) for _ in range(3)],
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert client._inflight == {}
+
+
+def test_cancelled_caller_does_not_cancel_coalesced_waiters():
+    async def slow():
+        await asyncio.sleep(0.01)
+        return 'done'
+
+    client = make_renderer(None).tr
+
+    async def run():
+        first = asyncio.ensure_future(client._coalesce('key', slow))
+        second = asyncio.ensure_future(client._coalesce('key', slow))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        result = await second
+
+        assert first.cancelled()
+        return result
+
+    assert asyncio.run(run()) == 'done'
+    assert client._inflight == {}
+
+
+def test_failed_case_does_not_drop_other_results(monkeypatch):
+    posted = []
+
+    def handler(request):
+        posted.extend(orjson.loads(request.content)['results'])
+        return httpx.Response(200, json=[])
+
+    renderer = make_renderer(handler)
+    renderer.run = 5
+
+    def first_case():
+        pass
+
+    def bad_case():
+        pass
+
+    def last_case():
+        pass
+
+    async def report_case(spec, case):
+        if case is bad_case:
+            raise KeyError('case_id')
+
+        renderer._pending.append({'case_id': case.__name__, 'status_id': 1})
+
+    monkeypatch.setattr(renderer, 'report_case', report_case)
+    spec = SharedSpec()
+
+    async def finish():
+        await renderer.run_reporting([(spec, first_case), (spec, bad_case), (spec, last_case)])
+        await renderer.finish_reporting()
+
+    asyncio.run(finish())
+
+    assert [result['case_id'] for result in posted] == ['first_case', 'last_case']
+
+
+def test_throttled_batch_is_retried_not_split():
+    requested = []
+    responses = [
+        httpx.Response(429, headers={'Retry-After': '0'}, json={'error': 'Rate limit'}),
+        httpx.Response(200, json=[]),
+    ]
+
+    def handler(request):
+        requested.append(route(request))
+        return responses.pop(0)
+
+    renderer = make_renderer(handler)
+    renderer.run = 5
+    renderer._pending = pending_results(3)
+
+    asyncio.run(renderer.finish_reporting())
+
+    assert requested == ['/api/v2/add_results_for_cases/5'] * 2
+
+
+def test_persistently_throttled_batch_is_not_split(caplog):
+    requested = []
+
+    def handler(request):
+        requested.append(route(request))
+        return httpx.Response(429, headers={'Retry-After': '0'}, json={'error': 'Rate limit'})
+
+    renderer = make_renderer(handler)
+    renderer.run = 5
+    renderer._pending = pending_results(3)
+
+    asyncio.run(renderer.finish_reporting())
+
+    assert requested == ['/api/v2/add_results_for_cases/5'] * testrail.RESULTS_BATCH_ATTEMPTS
+    assert 'for case ids: 0, 1, 2' in caplog.text
+
+
+class CommentSpec(Spec):
+    def passes(self):
+        expect('bam').to.equal('bam')
+
+    def fails_required(self):
+        actual = 'bam'
+        wanted = 'boom'
+        require(actual).to.equal(wanted)
+
+    def raises(self):
+        raise ValueError('bam')
+
+
+def test_report_case_comments():
+    spec = CommentSpec()
+    renderer = make_renderer(None)
+    renderer.run = 5
+
+    spec_data = testrail.TestRailSpecData(spec)
+    renderer.specs[spec._id] = spec_data
+    for case_id, case in enumerate(spec.__test_cases__):
+        spec_data.track_case({'id': case_id, 'section_id': 1}, case.__name__, case.__name__)
+
+    async def run_and_report():
+        await execute_spec(spec, asyncio.Semaphore(1), asyncio.Semaphore(1), ReportManager())
+        for case in spec.__test_cases__:
+            await renderer.report_case(spec, case)
+
+    asyncio.run(run_and_report())
+    comments = {
+        spec.__test_cases__[result['case_id']].__name__: result['comment']
+        for result in renderer._pending
+    }
+
+    assert comments['passes'] == "\u2192 \u2713 'bam' to equal 'bam'"
+    assert comments['fails_required'] == '\n'.join([
+        '\u219B \u2717 actual to equal wanted',
+        '    Values:',
+        '    -------',
+        '    | actual: bam',
+        '    | wanted: boom',
+    ])
+
+    errors = testrail.TestRailCaseData(spec, CommentSpec.raises).errors
+    assert comments['raises'] == '\n'.join([
+        '',
+        'Traceback occurred during execution',
+        '-' * 40,
+        *itertools.chain.from_iterable(errors),
+    ])
+    assert comments['raises'].endswith('->         raise ValueError(\'bam\')\n' + '-' * 40
+                                       + '\n- ValueError: bam\n' + '-' * 40)